@@ -0,0 +1,55 @@
+import os
+import json
+import base64
+import time
+import hashlib
+import threading
+
+
+class FileCache:
+    """
+    Tiny on-disk TTL cache for HTTP bodies (bytes, stored losslessly as base64).
+    One JSON file per URL: .cache/<md5(url)>.json -> {"ts": ..., "body_b64": ...}
+    """
+
+    def __init__(self, dir=".cache", ttl_s=3600):
+        self.dir = dir
+        self.ttl_s = ttl_s
+
+    def _path(self, url):
+        key = hashlib.md5(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.dir, f"{key}.json")
+
+    def get(self, url):
+        """
+        Return the cached body (bytes) for url, or None if missing/expired/unreadable.
+        """
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("ts", 0) >= self.ttl_s:
+            return None
+        body = entry.get("body_b64")
+        if body is None:
+            return None
+        try:
+            return base64.b64decode(body)
+        except ValueError:
+            return None
+
+    def set(self, url, body):
+        """
+        Store body (bytes) for url. Best effort: a cache write failure never breaks the run.
+        """
+        path = self._path(url)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            entry = {"ts": time.time(), "body_b64": base64.b64encode(body).decode("ascii")}
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)  # atomic, safe with concurrent writers
+        except OSError:
+            pass
@@ -1,79 +1,211 @@
 import os
 import json
 import time
+import io
 import random
+import operator
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 import requests
+from requests.adapters import HTTPAdapter
 import feedparser
-from openai import OpenAI
+import orjson
+from lxml import etree
+
+from cache import FileCache
 
 
 # -------- Helpers --------
 
+# One pooled session for every request: TLS handshake once per host, then keep-alive.
+# Retries are handled by get_with_retry, so the adapter itself never retries.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0))
+
+# (connect, read) timeouts. 3.05s is just over the 3s TCP SYN retransmit window,
+# so a dead connect fails fast and get_with_retry can try again.
+FETCH_TIMEOUT = (3.05, 15)
+TELEGRAM_TIMEOUT = (3.05, 10)
+
+QUOTE_CACHE = FileCache(ttl_s=12 * 3600)
+NEWS_CACHE = FileCache(ttl_s=3600)
+
+
+_HOLDINGS = {"mtime": 0, "data": None}
+
+
 def read_holdings():
+    """
+    Parse holdings.json, reusing the last result until the file's mtime changes
+    (matters when main() runs repeatedly inside a long-lived scheduler process).
+    """
+    st = os.stat("holdings.json")
+    if _HOLDINGS["data"] is not None and st.st_mtime == _HOLDINGS["mtime"]:
+        return _HOLDINGS["data"]
     with open("holdings.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+        data = json.load(f)
+    _HOLDINGS["mtime"] = st.st_mtime
+    _HOLDINGS["data"] = data
+    return data
 
 
 def get_with_retry(url, max_tries=6):
     """
-    Retry on 429 rate limit (common on GitHub Actions shared IPs).
-    Uses exponential backoff + jitter.
+    Retry on 429 rate limit (common on GitHub Actions shared IPs), 5xx,
+    connection errors and timeouts. Uses exponential backoff + jitter.
+    Other 4xx (bad symbol, 404, ...) and other request errors (bad URL,
+    redirect loop, ...) will never succeed, so they raise at once.
     """
     last_exc = None
     for attempt in range(max_tries):
         try:
-            r = requests.get(url, timeout=20)
-            if r.status_code == 429:
-                sleep_s = (2 ** attempt) + random.uniform(0.5, 1.5)
-                time.sleep(sleep_s)
-                continue
+            r = SESSION.get(url, timeout=FETCH_TIMEOUT)
             r.raise_for_status()
             return r
-        except Exception as e:
+        except requests.HTTPError as e:
+            status = e.response.status_code
+            if status != 429 and not 500 <= status < 600:
+                raise
+            last_exc = e
+        except (requests.ConnectionError, requests.Timeout) as e:
             last_exc = e
+        if attempt < max_tries - 1:
             sleep_s = (2 ** attempt) + random.uniform(0.5, 1.5)
             time.sleep(sleep_s)
     raise last_exc
 
 
+def fetch_cached(url, cache, validate=None):
+    """
+    get_with_retry() behind a FileCache. Returns the response body as bytes.
+    If given, validate(body) must be truthy for the body to be cached, so an
+    error payload served with 200 isn't replayed for the whole TTL.
+    """
+    body = cache.get(url)
+    if body is not None:
+        return body
+    r = get_with_retry(url)
+    if validate is None or validate(r.content):
+        cache.set(url, r.content)
+    return r.content
+
+
+YF_QUOTE_TMPL = "https://query1.finance.yahoo.com/v7/finance/quote?symbols={symbols}"
+YF_CHUNK_SIZE = 50  # Yahoo rejects batches above ~99 symbols
+YF_FIELDS = (
+    "symbol",
+    "shortName",
+    "regularMarketPrice",
+    "regularMarketChange",
+    "regularMarketChangePercent",
+    "currency",
+)
+_yf_fields = operator.itemgetter(*YF_FIELDS)
+
+
+def yf_body_ok(body):
+    """
+    True if a Yahoo quote payload is worth caching (no error, non-empty result).
+    """
+    try:
+        qr = orjson.loads(body).get("quoteResponse") or {}
+    except (orjson.JSONDecodeError, AttributeError):
+        return False
+    return not qr.get("error") and bool(qr.get("result"))
+
+
 def yf_quotes(symbols):
     """
-    Fetch ALL symbols in ONE Yahoo request to reduce rate limiting.
+    Fetch symbols in as few Yahoo requests as possible to reduce rate limiting
+    (chunks of YF_CHUNK_SIZE, fetched concurrently).
     Returns dict: { "AAPL": {price, change_pct, ...}, ... }
     """
     # Remove duplicates while preserving order
-    seen = set()
-    symbols = [s for s in symbols if s and not (s in seen or seen.add(s))]
+    symbols = list(dict.fromkeys(s for s in symbols if s))
 
-    joined = ",".join(symbols)
-    url = f"https://query1.finance.yahoo.com/v7/finance/quote?symbols={joined}"
+    chunks = [symbols[i:i + YF_CHUNK_SIZE] for i in range(0, len(symbols), YF_CHUNK_SIZE)]
+    urls = [YF_QUOTE_TMPL.format(symbols=",".join(c)) for c in chunks]
 
-    r = get_with_retry(url)
-    data = r.json().get("quoteResponse", {}).get("result", [])
+    def fetch_chunk(url):
+        # A failed chunk returns its exception so the other chunks still render
+        try:
+            body = fetch_cached(url, QUOTE_CACHE, validate=yf_body_ok)
+            return orjson.loads(body).get("quoteResponse", {}).get("result", [])
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(fetch_chunk, urls))
+
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed and len(failed) == len(results):
+        raise failed[0]
+
+    data = []
+    for r in results:
+        if not isinstance(r, Exception):
+            data.extend(r)
 
     out = {}
     for q in data:
-        sym = q.get("symbol")
+        try:
+            sym, name, price, change, change_pct, currency = _yf_fields(q)
+        except KeyError:
+            # Some quotes (indices, halted symbols) omit fields
+            sym, name, price, change, change_pct, currency = (q.get(k) for k in YF_FIELDS)
         out[sym] = {
             "symbol": sym,
-            "name": q.get("shortName") or q.get("longName") or sym,
-            "price": q.get("regularMarketPrice"),
-            "change": q.get("regularMarketChange"),
-            "change_pct": q.get("regularMarketChangePercent"),
-            "currency": q.get("currency"),
+            "name": name or q.get("longName") or sym,
+            "price": price,
+            "change": change,
+            "change_pct": change_pct,
+            "currency": currency,
         }
     return out
 
 
+RSS_TMPL = "https://news.google.com/rss/search?q={q}&hl=en-US&gl=US&ceid=US:en"
+
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+
+def feed_titles(body, limit=3):
+    """
+    Stream-parse RSS <item> / Atom <entry> elements with lxml (libxml2) and stop
+    after `limit`, instead of building the whole feed in memory.
+    Raises etree.XMLSyntaxError on malformed XML.
+    """
+    titles = []
+    seen = 0
+    entries = etree.iterparse(io.BytesIO(body), events=("end",), tag=("item", f"{ATOM_NS}entry"))
+    for _, elem in entries:
+        t = (elem.findtext("title") or elem.findtext(f"{ATOM_NS}title") or "").strip()
+        if t:
+            titles.append(t)
+        elem.clear()
+        seen += 1
+        if seen >= limit:
+            break
+    return titles
+
+
 def news_for(ticker, limit=3):
     """
     Google News RSS headlines (no API key).
     """
-    q = requests.utils.quote(f"{ticker} stock")
-    rss = f"https://news.google.com/rss/search?q={q}&hl=en-US&gl=US&ceid=US:en"
-    feed = feedparser.parse(rss)
+    rss = RSS_TMPL.format(q=urllib.parse.quote_plus(f"{ticker} stock"))
+    # Fetch ourselves (pooled session + retry + cache); we only parse here
+    body = fetch_cached(rss, NEWS_CACHE)
+    try:
+        return feed_titles(body, limit=limit)
+    except etree.XMLSyntaxError:
+        pass
+
+    # Malformed feed -> let feedparser's lenient parser have a go
+    feed = feedparser.parse(body)
     titles = []
     for e in feed.entries[:limit]:
         t = (e.get("title") or "").strip()
@@ -82,7 +214,21 @@ def news_for(ticker, limit=3):
     return titles
 
 
-def send_telegram(text):
+def safe_news(ticker, limit=3):
+    """
+    news_for() that returns None instead of raising (for use in worker threads).
+    """
+    try:
+        return news_for(ticker, limit=limit)
+    except Exception:
+        return None
+
+
+def send_telegram(text, max_tries=5):
+    """
+    Send one message. On 429 (per-chat flood limit) waits the retry_after Telegram
+    asks for; on 5xx backs off exponentially. Other errors raise at once.
+    """
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     chat_id = os.getenv("TELEGRAM_CHAT_ID")
 
@@ -95,8 +241,51 @@ def send_telegram(text):
         "text": text,
         "disable_web_page_preview": True
     }
-    r = requests.post(url, json=payload, timeout=20)
-    r.raise_for_status()
+    for attempt in range(max_tries):
+        r = SESSION.post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
+        if attempt < max_tries - 1:
+            if r.status_code == 429:
+                try:
+                    sleep_s = float(r.json().get("parameters", {}).get("retry_after") or 1)
+                except ValueError:
+                    sleep_s = 2 ** attempt
+                time.sleep(sleep_s + random.uniform(0.1, 0.5))
+                continue
+            if 500 <= r.status_code < 600:
+                time.sleep((2 ** attempt) + random.uniform(0.5, 1.5))
+                continue
+        r.raise_for_status()
+        return
+
+
+TELEGRAM_MAX_CHARS = 3800  # Telegram caps messages at 4096; leave some headroom
+TELEGRAM_MAX_PARTS = 4  # beyond this the digest is truncated rather than flooding the chat
+TELEGRAM_PART_DELAY_S = 1.0  # stay under Telegram's ~1 msg/s per-chat limit
+
+
+def split_message(text, limit=TELEGRAM_MAX_CHARS):
+    """
+    Split text into chunks of at most `limit` chars, breaking on line boundaries
+    where possible (only a single over-long line is cut mid-line).
+    """
+    parts = []
+    cur = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if cur:
+                parts.append(cur)
+                cur = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{cur}\n{line}" if cur else line
+        if len(candidate) > limit:
+            parts.append(cur)
+            cur = line
+        else:
+            cur = candidate
+    if cur:
+        parts.append(cur)
+    return parts
 
 
 def fmt_line(sym, q):
@@ -120,6 +309,9 @@ def ai_summarize(raw_text):
         return None  # signal: no AI
 
     try:
+        # Imported lazily: the client is heavy and only needed when AI is enabled
+        from openai import OpenAI
+
         client = OpenAI(api_key=api_key)
 
         instructions = (
@@ -136,11 +328,27 @@ def ai_summarize(raw_text):
             "- Plain English.\n"
         )
 
+        # Bounded prompt and completion: fewer tokens either way = faster response.
+        # Cut the input on a line boundary so the model never sees half a headline.
+        prompt = raw_text
+        if len(prompt) > 2000:
+            prompt = prompt[:2000]
+            if "\n" in prompt:
+                prompt = prompt[:prompt.rindex("\n")]
+
+        # ~1200 chars of English bullets is roughly 300 tokens, so 400 leaves headroom.
+        # Reasoning tokens count against the same cap, so reasoning is turned off.
         resp = client.responses.create(
             model="gpt-5.2",
-            input=raw_text,
-            instructions=instructions
+            input=prompt,
+            instructions=instructions,
+            max_output_tokens=400,
+            reasoning={"effort": "none"},
         )
+        # Hitting the token cap yields status "incomplete" with a summary cut
+        # mid-bullet; better to fall back to the raw digest than send that
+        if resp.status != "completed":
+            return None
         text = (resp.output_text or "").strip()
         return text if text else None
     except Exception:
@@ -157,19 +365,30 @@ def main():
 
     now_utc = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
 
+    # No size budget here: split_message() sends everything to Telegram, and
+    # ai_summarize() bounds its own input
     lines = []
     lines.append("📊 Weekly Market & Economy Update")
     lines.append(f"🕒 Generated: {now_utc}")
     lines.append("")
 
-    # Quotes (safe fallback)
-    quotes = {}
-    yahoo_failed = False
-    try:
-        quotes = yf_quotes(all_symbols)
-    except Exception:
-        yahoo_failed = True
+    # Network: Yahoo quotes and every RSS feed are fetched concurrently,
+    # so wall-clock is roughly the slowest single request.
+    with ThreadPoolExecutor(max_workers=min(8, len(tickers)) + 1) as pool:
+        quotes_future = pool.submit(yf_quotes, all_symbols)
+        # One fetch per distinct ticker, even if holdings.json repeats one
+        news_futures = {t: pool.submit(safe_news, t) for t in dict.fromkeys(tickers)}
+
+        # Quotes (safe fallback)
         quotes = {}
+        yahoo_failed = False
+        try:
+            quotes = quotes_future.result()
+        except Exception:
+            yahoo_failed = True
+            quotes = {}
+
+        news = [(t, news_futures[t].result()) for t in tickers]
 
     # Your stocks
     lines.append("💼 Your Stocks")
@@ -187,52 +406,59 @@ def main():
         for i in indices:
             lines.append(fmt_line(i, quotes.get(i)))
 
+    # Placed before the headlines so it stays inside the AI input slice
+    if yahoo_failed:
+        lines.append("")
+        lines.append("⚠️ Note: price data fetch failed (rate-limit/network). Headlines still included.")
+
     # Headlines
     lines.append("")
     lines.append("📰 Headlines")
     if not tickers:
         lines.append("- (no tickers to fetch news for)")
     else:
-        for t in tickers:
-            try:
-                hs = news_for(t, limit=3)
-                if not hs:
-                    lines.append(f"- {t}: (no headlines found)")
-                else:
-                    for h in hs:
-                        lines.append(f"- {t}: {h}")
-            except Exception:
+        for t, hs in news:
+            if hs is None:
                 lines.append(f"- {t}: (news fetch failed)")
-
-    if yahoo_failed:
-        lines.append("")
-        lines.append("⚠️ Note: price data fetch failed (rate-limit/network). Headlines still included.")
+            elif not hs:
+                lines.append(f"- {t}: (no headlines found)")
+            else:
+                for h in hs:
+                    lines.append(f"- {t}: {h}")
 
     raw_msg = "\n".join(lines)
-    raw_msg = raw_msg[:3800]  # keep bounded for Telegram + OpenAI input
 
     # AI Summary (optional)
     summary = ai_summarize(raw_msg)
 
+    footer = ""
     if summary:
-        # One message: summary first, then a shorter details block
-        details = raw_msg
-        # Keep details shorter so total stays within Telegram limits comfortably
-        details = details[:2000]
-
+        # Summary first, then the full details block
         final_msg = (
             "🧠 AI Weekly Brief\n"
             f"{summary}\n\n"
             "—\n"
             "📌 Details\n"
-            f"{details}"
+            f"{raw_msg}"
         )
     else:
         # No AI key or AI failed -> send raw
-        final_msg = raw_msg + "\n\nTip: Add OPENAI_API_KEY secret to enable AI summary."
-
-    final_msg = final_msg[:3800]
-    send_telegram(final_msg)
+        final_msg = raw_msg
+        footer = "\n\nTip: Add OPENAI_API_KEY secret to enable AI summary."
+
+    # Split into at most TELEGRAM_MAX_PARTS messages, sent over SESSION's
+    # keep-alive connection to api.telegram.org. Room is reserved so the footer
+    # and truncation note ride on the last part rather than going out on their own.
+    trunc_note = "\n\n… (digest truncated: too long for Telegram)"
+    parts = split_message(final_msg, TELEGRAM_MAX_CHARS - len(footer) - len(trunc_note))
+    if len(parts) > TELEGRAM_MAX_PARTS:
+        parts = parts[:TELEGRAM_MAX_PARTS]
+        parts[-1] += trunc_note
+    parts[-1] += footer
+    for n, part in enumerate(parts):
+        if n:
+            time.sleep(TELEGRAM_PART_DELAY_S)
+        send_telegram(part)
 
 
 if __name__ == "__main__":